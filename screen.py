@@ -1,8 +1,14 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import pickle
-import plotly.express as px
+import hashlib
+import io
+import os
+import tempfile
+import plotly.io as pio
 from pathlib import Path
+from datetime import date
 
 # ==================== CONFIGURAÇÃO INICIAL ====================
 st.set_page_config(
@@ -14,104 +20,522 @@ st.set_page_config(
 
 # ==================== CARREGAR DADOS ====================
 
-@st.cache_data
+# Colunas do arquivo de entrada efetivamente usadas pelo dashboard
+COLUNAS_ENTRADA = [
+    'cliente_nome',
+    'cnpj_matriz',
+    'produto_codigo',
+    'produto_descricao',
+    'qtd_vendida_para_farmacia',
+    'qtd_vendida_para_cliente',
+    'diferenca',
+    'mes_ano'
+]
+
+
+def downcast(valores: pd.Series) -> pd.Series:
+    """
+    Converte a série para o menor tipo numpy que a representa: o menor inteiro
+    quando todos os valores são inteiros, senão float32.
+    """
+    valores = pd.to_numeric(valores)
+    if valores.notna().all() and (valores % 1 == 0).all():
+        return pd.to_numeric(valores.astype('int64'), downcast='integer')
+    return valores.astype('float32')
+
+
 def load_data_from_file(path: Path) -> pd.DataFrame:
+    """
+    Lê o parquet que fica ao lado do pickle, apenas com as colunas usadas.
+    Se o parquet não existir, for mais antigo que o pickle ou não puder ser lido,
+    lê o pickle e grava o parquet para as próximas cargas.
+    """
+    parquet_path = path.with_suffix('.parquet')
+    if parquet_path.exists() and (
+            not path.exists() or parquet_path.stat().st_mtime >= path.stat().st_mtime):
+        try:
+            return pd.read_parquet(parquet_path, columns=COLUNAS_ENTRADA, engine='pyarrow')
+        except Exception:
+            if not path.exists():
+                raise
+            # Parquet corrompido ou incompleto: refaz a partir do pickle
+
     with open(path, 'rb') as f:
         df = pickle.load(f)
+
+    # O parquet é só um atalho de leitura: qualquer falha na conversão mantém o
+    # pickle já carregado. A gravação vai para um arquivo temporário no mesmo
+    # diretório e só substitui o parquet quando está completa
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=parquet_path.parent, suffix='.parquet.tmp')
+        os.close(fd)
+        df[COLUNAS_ENTRADA].to_parquet(tmp_path, engine='pyarrow', compression='zstd')
+        os.replace(tmp_path, parquet_path)
+        tmp_path = None
+    except Exception:
+        pass
+    finally:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
     return df
 
 
-def load_data():
-    """Carrega dados do arquivo pickle"""
+@st.cache_data
+def _prepare(origem: str, _conteudo: bytes | None = None) -> pd.DataFrame:
+    """
+    Carrega e prepara os dados (conversão de data, seleção e renomeação de colunas).
+    `origem` é a chave do cache: o caminho do arquivo local ou o hash md5 do arquivo
+    enviado, cujo conteúdo vem em `_conteudo` (ignorado no hash do cache).
+    """
+    if _conteudo is None:
+        df = load_data_from_file(Path(origem))
+    elif _conteudo[:4] == b'PAR1':
+        df = pd.read_parquet(io.BytesIO(_conteudo), columns=COLUNAS_ENTRADA, engine='pyarrow')
+    else:
+        df = pickle.loads(_conteudo)
+
+    # Descarta de imediato as colunas não usadas (o parquet já é lido só com elas)
+    if df.columns.tolist() != COLUNAS_ENTRADA:
+        df = df[COLUNAS_ENTRADA]
+
+    # Conversão da data: há poucos meses distintos, então cada "MM-YYYY" único é
+    # convertido uma vez e espalhado pelas linhas através dos códigos do factorize
+    codigos, meses = pd.factorize(df['mes_ano'])
+    df['mes_ano_dt'] = pd.to_datetime(meses, format='%m-%Y').take(
+        codigos, allow_fill=True, fill_value=pd.NaT).to_numpy()
+
+    # Retornar apenas as colunas necessárias já renomeadas (o reindex já gera um
+    # dataframe próprio, sem precisar de .copy())
+    df_final = df.reindex(columns=[
+        'cliente_nome',
+        'cnpj_matriz',
+        'produto_codigo',
+        'produto_descricao',
+        'qtd_vendida_para_farmacia',
+        'qtd_vendida_para_cliente',
+        'diferenca',
+        'mes_ano_dt'  # Manter para filtro de data
+    ])
+
+    # Renomear colunas
+    df_final.columns = [
+        'Grupo',
+        'CNPJ',
+        'Produto',
+        'Descrição',
+        'Sell-in',
+        'Sell-out',
+        'Diferença',
+        'mes_ano_dt'
+    ]
+
+    # Quantidades em tipos numéricos estreitos: menos bytes movidos em filtros e cumsums
+    for col in ('Sell-in', 'Sell-out', 'Diferença'):
+        df_final[col] = downcast(df_final[col])
+
+    # Colunas de texto repetidas como categorias: agrupamentos, ordenações e
+    # filtros passam a comparar códigos inteiros em vez de strings. As categorias
+    # são ordenadas aqui, uma única vez, e servem direto como opções dos filtros
+    for col in ('Grupo', 'CNPJ', 'Produto', 'Descrição'):
+        categorias = sorted(df_final[col].unique())
+        df_final[col] = df_final[col].astype(pd.CategoricalDtype(categorias, ordered=True))
+
+    # Ordenação definitiva (mês/ano, grupo e produto), feita uma única vez: os
+    # filtros preservam essa ordem, que serve às cumsums, ao gráfico e à tabela
+    df_final.sort_values(['mes_ano_dt', 'Grupo', 'Descrição'], inplace=True)
+    df_final.reset_index(drop=True, inplace=True)
+
+    return df_final
+
+
+def load_data() -> tuple[pd.DataFrame, str | None]:
+    """
+    Carrega dados do arquivo parquet (ou do pickle original).
+    Retorna o dataframe e a origem usada como chave do cache (None se não houver dados).
+    """
     try:
         # Caminho relativo ao app
         data_path = Path(__file__).parent / "input_files" / "analise_cruzada.pkl"
 
-        if data_path.exists():
-            df = load_data_from_file(data_path)
-        else:
-            st.warning("Arquivo local não encontrado. Envie o .pkl para carregar os dados.")
-            uploaded = st.file_uploader("Envie o arquivo analise_cruzada.pkl", type=["pkl"])
-            if not uploaded:
-                return pd.DataFrame()
-            df = pickle.load(uploaded)
-
-        # Conversão da data
-        df['mes_ano_dt'] = pd.to_datetime(df['mes_ano'], format='%m-%Y').dt.date
-
-        # Retornar apenas as colunas necessárias já renomeadas
-        df_final = df[[
-            'cliente_nome',
-            'cnpj_matriz',
-            'produto_codigo',
-            'produto_descricao',
-            'qtd_vendida_para_farmacia',
-            'qtd_vendida_para_cliente',
-            'diferenca',
-            'mes_ano_dt'  # Manter para filtro de data
-        ]].copy()
-
-        # Renomear colunas
-        df_final.columns = [
-            'Grupo',
-            'CNPJ',
-            'Produto',
-            'Descrição',
-            'Sell-in',
-            'Sell-out',
-            'Diferença',
-            'mes_ano_dt'
-        ]
-
-        return df_final
+        if data_path.exists() or data_path.with_suffix('.parquet').exists():
+            origem = str(data_path)
+            return _prepare(origem), origem
+
+        st.warning("Arquivo local não encontrado. Envie o .pkl ou .parquet para carregar os dados.")
+        uploaded = st.file_uploader("Envie o arquivo analise_cruzada.pkl ou analise_cruzada.parquet", type=["pkl", "parquet"])
+        if not uploaded:
+            return pd.DataFrame(), None
+
+        conteudo = uploaded.getvalue()
+        origem = hashlib.md5(conteudo).hexdigest()
+        return _prepare(origem, conteudo), origem
 
     except FileNotFoundError:
         st.error("Arquivo não encontrado: input_files/analise_cruzada.pkl")
-        return pd.DataFrame()
+        return pd.DataFrame(), None
     except Exception as e:
         st.error(f"Erro ao carregar dados: {str(e)}")
-        return pd.DataFrame()
+        return pd.DataFrame(), None
 
 
 # ==================== CALCULAR SOMAS ACUMULATIVAS ====================
+def grouped_cumsum(codigos: np.ndarray, valores: np.ndarray) -> np.ndarray:
+    """
+    Soma acumulada por grupo em numpy, para agrupamentos por uma única coluna.
+    `codigos` são os códigos de categoria de cada linha e `valores` um array com uma
+    ou mais colunas. A acumulação segue a ordem das linhas dentro de cada grupo e o
+    resultado volta na ordem original.
+    Como no groupby().cumsum(), valores faltantes ficam NaN sem interromper a soma
+    do grupo, e linhas sem categoria (código -1) ficam NaN.
+    """
+    # Ordenação estável pelos códigos (radix sort para inteiros pequenos): junta
+    # cada grupo mantendo a ordem cronológica das linhas
+    ordem = np.argsort(codigos, kind='stable')
+    c = codigos[ordem]
+    sem_grupo = c < 0
+    tipo = np.result_type(valores.dtype, np.int64)
+    if sem_grupo.any():
+        tipo = np.result_type(tipo, np.float64)
+    v = valores[ordem].astype(tipo)
+    if len(c) == 0:
+        return v
+
+    # NaN somaria no total contínuo e contaminaria os grupos seguintes: entra como 0
+    # na soma e volta a ser NaN no resultado
+    faltantes = np.isnan(v) if v.dtype.kind == 'f' else None
+    if faltantes is not None:
+        v[faltantes] = 0
+
+    # Soma acumulada contínua, descontando em cada grupo o total acumulado até o seu início
+    total = np.cumsum(v, axis=0)
+    inicios = np.flatnonzero(np.r_[True, c[1:] != c[:-1]])
+    base = total[inicios] - v[inicios]
+    total -= np.repeat(base, np.diff(np.r_[inicios, len(c)]), axis=0)
+
+    if faltantes is not None:
+        total[faltantes] = np.nan
+    if sem_grupo.any():
+        total[sem_grupo] = np.nan
+
+    resultado = np.empty_like(total)
+    resultado[ordem] = total
+    return resultado
+
+
 def calculate_cumsums(df: pd.DataFrame) -> pd.DataFrame:
     """
     Calcula as somas acumulativas baseadas no dataframe filtrado.
     As cumsums são calculadas apenas para os dados no dataframe fornecido,
     resetando no início do período filtrado.
+    O dataframe deve vir ordenado por data (como sai do carregamento): dentro de
+    qualquer agrupamento as linhas já estão em ordem cronológica.
+    As colunas são adicionadas no próprio dataframe recebido, que não deve ser
+    uma fatia do dataframe em cache.
     """
-    df = df.copy()
-    
     # Estoque Total por Produto (agrupado por Descrição)
-    df = df.sort_values(['Descrição', 'mes_ano_dt'])
-    df['Estoque Total por Produto'] = df.groupby('Descrição')['Diferença'].cumsum()
-    
-    # Estoque por Grupo (agrupado por Grupo)
-    df = df.sort_values(['Grupo', 'mes_ano_dt'])
-    df['Estoque por Grupo'] = df.groupby('Grupo')['Diferença'].cumsum()
-    
-    # Sell-in por Grupo (agrupado por Grupo)
-    df = df.sort_values(['Grupo', 'mes_ano_dt'])
-    df['Sell-in por Grupo'] = df.groupby('Grupo')['Sell-in'].cumsum()
-    
-    # Sell-out por Grupo (agrupado por Grupo)
-    df = df.sort_values(['Grupo', 'mes_ano_dt'])
-    df['Sell-out por Grupo'] = df.groupby('Grupo')['Sell-out'].cumsum()
-    
+    df['Estoque Total por Produto'] = grouped_cumsum(
+        df['Descrição'].array.codes, df['Diferença'].to_numpy())
+
+    # Estoque, Sell-in e Sell-out por Grupo (agrupados por Grupo), numa única passada
+    df[['Estoque por Grupo', 'Sell-in por Grupo', 'Sell-out por Grupo']] = grouped_cumsum(
+        df['Grupo'].array.codes, df[['Diferença', 'Sell-in', 'Sell-out']].to_numpy())
+
     # Estoque por Produto e Grupo (agrupado por Descrição e Grupo)
-    df = df.sort_values(['Descrição', 'Grupo', 'mes_ano_dt'])
-    df['Estoque por Produto e Grupo'] = df.groupby(['Descrição', 'Grupo'])['Diferença'].cumsum()
-    
+    df['Estoque por Produto e Grupo'] = df.groupby(['Descrição', 'Grupo'], sort=False, observed=True)['Diferença'].cumsum()
+
+    # As somas acumulam em 64 bits; os acumulados voltam ao menor tipo que os representa
+    for col in ('Estoque Total por Produto', 'Estoque por Grupo', 'Sell-in por Grupo',
+                'Sell-out por Grupo', 'Estoque por Produto e Grupo'):
+        df[col] = downcast(df[col])
+
     return df
 
 
+# ==================== FILTRAR DADOS ====================
+@st.cache_data(max_entries=32, show_spinner=False)
+def get_view(origem: str, _df: pd.DataFrame, produto: str, grupo: str,
+             start_date: date, end_date: date) -> pd.DataFrame:
+    """
+    Aplica os filtros e calcula as somas acumulativas do período filtrado.
+    O cache é indexado pela origem dos dados e pela seleção dos filtros, de modo que
+    voltar a uma combinação já vista não refaz o trabalho. `_df` fica fora do hash.
+    """
+    df = _df
+
+    # Aplicar filtro de data: o dataframe vem ordenado por data do carregamento,
+    # então o período vira um recorte posicional encontrado por busca binária.
+    # Limites em datetime64, com o dia final incluído
+    inicio = np.datetime64(pd.Timestamp(start_date))
+    fim = np.datetime64(pd.Timestamp(end_date)) + np.timedelta64(1, 'D')
+    lo, hi = np.searchsorted(df['mes_ano_dt'].values, [inicio, fim])
+    df_periodo = df.iloc[lo:hi]
+
+    # Aplicar filtros: uma única máscara booleana sobre o período e um único recorte.
+    # A seleção vira o código da categoria e a comparação é feita nos códigos inteiros
+    mask = np.ones(len(df_periodo), dtype=bool)
+
+    if grupo != 'All':
+        codigo = df['Grupo'].cat.categories.get_loc(grupo)
+        mask &= (df_periodo['Grupo'].array.codes == codigo)
+
+    if produto != 'All':
+        codigo = df['Descrição'].cat.categories.get_loc(produto)
+        mask &= (df_periodo['Descrição'].array.codes == codigo)
+
+    # take gera um dataframe próprio, que calculate_cumsums pode alterar sem cópia
+    df_filtered = df_periodo.take(np.flatnonzero(mask))
+
+    if df_filtered.empty:
+        return df_filtered
+
+    return calculate_cumsums(df_filtered)
+
+
+# ==================== RESUMO ====================
+def count_present(col: pd.Series) -> int:
+    """Quantos valores distintos de uma coluna categórica aparecem nela (contagem pelos códigos)"""
+    codigos = col.cat.codes.to_numpy()
+    presentes = np.zeros(len(col.cat.categories), dtype=bool)
+    presentes[codigos[codigos >= 0]] = True
+    return int(presentes.sum())
+
+
+def summarize(df: pd.DataFrame) -> dict:
+    """
+    Estatísticas do resumo da sidebar para o dataframe filtrado.
+    Como ele vem ordenado por data, o período é a primeira e a última linha.
+    """
+    return {
+        'grupos': count_present(df['Grupo']),
+        'produtos': count_present(df['Descrição']),
+        'registros': len(df),
+        'inicio': df['mes_ano_dt'].iat[0],
+        'fim': df['mes_ano_dt'].iat[-1]
+    }
+
+
+# ==================== GRÁFICOS ====================
+
+# Máximo de pontos por série enviados ao navegador
+MAX_PONTOS_GRAFICO = 2000
+
+# Acima deste número de pontos os marcadores deixam de ser desenhados
+MAX_PONTOS_MARCADORES = 200
+
+# Linhas da tabela enviadas ao navegador por página
+LINHAS_POR_PAGINA = 1000
+
+# Layout comum a todos os gráficos, aplicado por template sobre o tema do Streamlit
+# (o plotly.io já vem carregado pelo próprio Streamlit). A altura fica na própria
+# figura: o st.plotly_chart só lê layout.height e ignora a do template
+pio.templates['biowell'] = dict(
+    layout=dict(
+        legend=dict(
+            yanchor="top",
+            y=0.99,
+            xanchor="left",
+            x=0.01
+        ),
+        hovermode='x unified'  # Mostra todos os valores no mesmo ponto
+    )
+)
+TEMPLATE_GRAFICO = 'streamlit+biowell'
+
+
+def plot_chart(fig) -> None:
+    """
+    Exibe o gráfico no Streamlit. Séries com mais de MAX_PONTOS_GRAFICO pontos
+    são reduzidas no servidor (LTTB, via plotly-resampler) antes do envio.
+    """
+    # Import adiado: só é pago quando há gráfico a exibir
+    from plotly_resampler import FigureResampler
+
+    fig = FigureResampler(
+        fig,
+        default_n_shown_samples=MAX_PONTOS_GRAFICO,
+        # Mantém os nomes das séries na legenda sem os marcadores do resampler
+        resampled_trace_prefix_suffix=('', ''),
+        show_mean_aggregation_size=False
+    )
+    st.plotly_chart(fig, width='stretch')
+
+
+def build_chart(df_grafico: pd.DataFrame, colunas: list, titulo: str, use_markers: bool):
+    """
+    Monta o gráfico de Estoque (cor padrão), Sell-in (verde) e Sell-out (vermelho)
+    com um único px.line: as três colunas são empilhadas em formato longo e
+    separadas por cor. `colunas` traz as colunas de estoque, Sell-in e Sell-out.
+    """
+    # Import adiado: a visão padrão (All/All) não desenha gráfico
+    import plotly.express as px
+
+    legendas = [colunas[0], 'Sell-in', 'Sell-out']
+    df_long = df_grafico[['mes_ano_dt', *colunas]].rename(columns=dict(zip(colunas, legendas))).melt(
+        id_vars='mes_ano_dt',
+        var_name='Métrica',
+        value_name='Valor'
+    )
+
+    fig = px.line(
+        df_long,
+        x='mes_ano_dt',
+        y='Valor',
+        color='Métrica',
+        color_discrete_map={'Sell-in': 'green', 'Sell-out': 'red'},
+        title=titulo,
+        labels={'mes_ano_dt': 'Período', 'Valor': 'Quantidade', 'Métrica': ''},
+        markers=use_markers,
+        render_mode='webgl',
+        height=400,
+        template=TEMPLATE_GRAFICO
+    )
+
+    # Estoque sem cor fixa: usa a primeira cor do tema (o px avançaria na sequência)
+    fig.data[0].line.color = None
+
+    # Hover com o nome completo da coluna (a legenda usa o nome curto)
+    for trace, coluna in zip(fig.data, colunas):
+        trace.hovertemplate = f'<b>{coluna}</b><br>' + \
+                              'Período: %{x}<br>' + \
+                              'Valor: %{y:,.0f}<br>' + \
+                              '<extra></extra>'
+    return fig
+
+
+def reuse_chart(chave: tuple, df_grafico: pd.DataFrame, colunas: list, use_markers: bool):
+    """
+    Reaproveita o gráfico guardado em st.session_state quando a chave (seleção de
+    Produto e Grupo) não mudou, atualizando apenas os dados das séries, como no
+    Plotly.react. Retorna None quando o gráfico precisa ser construído do zero.
+    """
+    guardado = st.session_state.get('grafico')
+    if guardado is None or guardado[0] != chave:
+        return None
+
+    fig = guardado[1]
+    x = df_grafico['mes_ano_dt'].to_numpy()
+    for trace, coluna in zip(fig.data, colunas):
+        trace.update(
+            x=x,
+            y=df_grafico[coluna].to_numpy(),
+            mode='lines+markers' if use_markers else 'lines'
+        )
+    return fig
+
+
+# ==================== ABA 1: ACOMPANHAMENTO DE ESTOQUE ====================
+@st.fragment
+def render_stock_tab(df_filtered: pd.DataFrame, produto_selecionado: str, farmacia_selecionada: str):
+    """
+    Gráfico e tabela da aba de acompanhamento de estoque. Como fragmento, os widgets
+    da aba (paginação da tabela) reexecutam só este trecho, sem refazer filtros e somas.
+    """
+    st.header("Detalhes por Grupo e Produto")
+
+    # Gráfico de Estoque
+    if farmacia_selecionada == 'All' and produto_selecionado == 'All':
+        st.info("🔍 Selecione um Grupo ou um Produto para visualizar o gráfico de estoque")
+    else:
+        # Dados do gráfico (já ordenados por data)
+        df_grafico = df_filtered
+
+        if produto_selecionado == 'All':
+            # As séries por Grupo são acumuladas e se repetem em cada linha do mês:
+            # basta o último valor de cada mês, que é o saldo do fechamento
+            df_grafico = df_grafico.drop_duplicates('mes_ano_dt', keep='last')
+
+        # Marcadores só quando os pontos ainda são distinguíveis
+        use_markers = len(df_grafico) <= MAX_PONTOS_MARCADORES
+
+        # Enquanto a seleção de Produto/Grupo não muda, o gráfico é reaproveitado
+        chave_grafico = (produto_selecionado, farmacia_selecionada)
+
+        # if produto_selecionado != 'All' and farmacia_selecionada == 'All':
+        #     # Mostrar Estoque Total por Produto
+        #     fig = px.line(
+        #         df_grafico,
+        #         x='mes_ano_dt',
+        #         y='Estoque Total por Produto',
+        #         title=f'Estoque Total - {produto_selecionado}',
+        #         markers=True
+        #     )
+        #     fig.update_layout(
+        #         xaxis_title='Período',
+        #         yaxis_title='Estoque Acumulado',
+        #         height=400
+        #     )
+        #     st.plotly_chart(fig, width='stretch')
+
+        if produto_selecionado == 'All' and farmacia_selecionada != 'All':
+            colunas_grafico = ['Estoque por Grupo', 'Sell-in por Grupo', 'Sell-out por Grupo']
+            fig = reuse_chart(chave_grafico, df_grafico, colunas_grafico, use_markers)
+            if fig is None:
+                fig = build_chart(
+                    df_grafico,
+                    colunas_grafico,
+                    f'Estoque, Sell-in e Sell-out por Grupo - {farmacia_selecionada}',
+                    use_markers
+                )
+                st.session_state['grafico'] = (chave_grafico, fig)
+
+            plot_chart(fig)
+
+        elif produto_selecionado != 'All' and farmacia_selecionada != 'All':
+            # Mostrar Estoque por Farmácia específica com Sell-in e Sell-out
+            colunas_grafico = ['Estoque por Produto e Grupo', 'Sell-in', 'Sell-out']
+            fig = reuse_chart(chave_grafico, df_grafico, colunas_grafico, use_markers)
+            if fig is None:
+                fig = build_chart(
+                    df_grafico,
+                    colunas_grafico,
+                    f'Estoque, Sell-in e Sell-out - {produto_selecionado} - {farmacia_selecionada}',
+                    use_markers
+                )
+                st.session_state['grafico'] = (chave_grafico, fig)
+
+            plot_chart(fig)
+
+    # Já ordenada por mês/ano, farmácia e produto desde o carregamento
+    df_tabela = df_filtered[['mes_ano_dt', 'Grupo', 'Descrição', 'Sell-in', 'Sell-out', 'Diferença']]
+
+    # Paginação: só a página atual da tabela é serializada e enviada
+    total_paginas = max(1, -(-len(df_tabela) // LINHAS_POR_PAGINA))
+    pagina = 1
+    if total_paginas > 1:
+        pagina = st.number_input(
+            f"Página (de {total_paginas}):",
+            min_value=1,
+            max_value=total_paginas,
+            value=1,
+            step=1
+        )
+    inicio = (pagina - 1) * LINHAS_POR_PAGINA
+
+    # Exibir tabela (com as 5 colunas principais)
+    st.dataframe(
+        df_tabela.iloc[inicio:inicio + LINHAS_POR_PAGINA],
+        width='stretch',
+        height=600, 
+        column_config={
+            "mes_ano_dt": st.column_config.DateColumn(
+                "Mês/Ano",
+                format="MM-YYYY" 
+            )
+        }
+    )
+
+
 # ==================== APLICAÇÃO PRINCIPAL ====================
 def main():
     # Título
     st.title("💊 Dashboard Sell-in/Sell-out - Grupos - BioWell")
 
     # Carregar dados
-    df = load_data()
+    df, origem = load_data()
 
     if df.empty:
         st.warning("Nenhum dado disponível")
@@ -122,8 +546,9 @@ def main():
 
     # Filtro de Data
     if 'mes_ano_dt' in df.columns:
-        min_date = df['mes_ano_dt'].min()
-        max_date = df['mes_ano_dt'].max()
+        # O widget trabalha com datetime.date; a coluna continua datetime64
+        min_date = df['mes_ano_dt'].min().date()
+        max_date = df['mes_ano_dt'].max().date()
 
         date_range = st.sidebar.date_input(
             "Período:",
@@ -141,7 +566,8 @@ def main():
             start_date = end_date = date_range if not isinstance(date_range, tuple) else date_range[0]
 
     # Filtro de Produto (seleção única com opção All)
-    produtos_disponiveis = ['All'] + sorted(df['Descrição'].unique())
+    # As categorias já são os valores únicos, ordenados no carregamento
+    produtos_disponiveis = ['All'] + df['Descrição'].cat.categories.tolist()
     produto_selecionado = st.sidebar.selectbox(
         "Produto:",
         options=produtos_disponiveis,
@@ -149,213 +575,39 @@ def main():
     )
 
     # Filtro de Farmácia (seleção única com opção All)
-    farmacias_disponiveis = ['All'] + sorted(df['Grupo'].unique())
+    farmacias_disponiveis = ['All'] + df['Grupo'].cat.categories.tolist()
     farmacia_selecionada = st.sidebar.selectbox(
         "Grupo:",
         options=farmacias_disponiveis,
         index=0  # Default: All
     )
 
-    # Aplicar filtros
-    df_filtered = df.copy()
-
-    if farmacia_selecionada != 'All':
-        df_filtered = df_filtered[df_filtered['Grupo'] == farmacia_selecionada]
-
-    if produto_selecionado != 'All':
-        df_filtered = df_filtered[df_filtered['Descrição'] == produto_selecionado]
-
-    # Aplicar filtro de data
-    if 'mes_ano_dt' in df_filtered.columns:
-        df_filtered = df_filtered[
-            (df_filtered['mes_ano_dt'] >= start_date) &
-            (df_filtered['mes_ano_dt'] <= end_date)
-            ]
+    # Aplicar filtros e calcular somas acumulativas baseadas no período filtrado
+    df_filtered = get_view(origem, df, produto_selecionado, farmacia_selecionada, start_date, end_date)
 
     if df_filtered.empty:
         st.warning("Nenhum dado encontrado com os filtros aplicados")
         return
 
-    # Calcular somas acumulativas baseadas no período filtrado
-    df_filtered = calculate_cumsums(df_filtered)
+    # Informações na sidebar (fora das abas: o fragmento da aba não escreve na sidebar)
+    st.sidebar.markdown("---")
+    st.sidebar.header("📊 Resumo")
+
+    resumo = summarize(df_filtered)
+    st.sidebar.info(f"""
+    **Dados filtrados:**
+    - Grupos: {resumo['grupos']}
+    - Produtos: {resumo['produtos']}
+    - Total registros: {resumo['registros']}
+    - Período: {resumo['inicio'].strftime('%d-%m-%Y')} a {resumo['fim'].strftime('%d-%m-%Y')}
+    """)
 
     # Abas principais
     tab1, tab2 = st.tabs(["📊 Acompanhamento de Estoque", "🔄 Giro de Estoque"])
 
     # ==================== ABA 1: ACOMPANHAMENTO DE ESTOQUE ====================
     with tab1:
-        st.header("Detalhes por Grupo e Produto")
-
-        # Gráfico de Estoque
-        if farmacia_selecionada == 'All' and produto_selecionado == 'All':
-            st.info("🔍 Selecione um Grupo ou um Produto para visualizar o gráfico de estoque")
-        else:
-            # Ordenar dados para o gráfico
-            df_grafico = df_filtered.sort_values(['mes_ano_dt'])
-
-            # if produto_selecionado != 'All' and farmacia_selecionada == 'All':
-            #     # Mostrar Estoque Total por Produto
-            #     fig = px.line(
-            #         df_grafico,
-            #         x='mes_ano_dt',
-            #         y='Estoque Total por Produto',
-            #         title=f'Estoque Total - {produto_selecionado}',
-            #         markers=True
-            #     )
-            #     fig.update_layout(
-            #         xaxis_title='Período',
-            #         yaxis_title='Estoque Acumulado',
-            #         height=400
-            #     )
-            #     st.plotly_chart(fig, width='stretch')
-
-            if produto_selecionado == 'All' and farmacia_selecionada != 'All':
-                fig = px.line(
-                    df_grafico,
-                    x='mes_ano_dt',
-                    y='Estoque por Grupo',
-                    title=f'Estoque, Sell-in e Sell-out por Grupo - {farmacia_selecionada}',
-                    markers=True
-                )
-                # Adicionar linha de Sell-in (verde)
-                fig.add_trace(px.line(
-                    df_grafico,
-                    x='mes_ano_dt',
-                    y='Sell-in por Grupo',
-                    markers=True,
-                    color_discrete_sequence=['green']
-                ).data[0].update(name='Sell-in'))
-                
-                # Adicionar linha de Sell-out (vermelho)
-                fig.add_trace(px.line(
-                    df_grafico,
-                    x='mes_ano_dt',
-                    y='Sell-out por Grupo',
-                    markers=True,
-                    color_discrete_sequence=['red']
-                ).data[0].update(name='Sell-out'))
-                
-                # Atualizar o nome da linha de estoque
-                fig.data[0].name = 'Estoque por Grupo'
-                
-                # Configurar hover personalizado para cada linha
-                fig.data[0].hovertemplate = '<b>Estoque por Grupo</b><br>' + \
-                                          'Período: %{x}<br>' + \
-                                          'Valor: %{y:,.0f}<br>' + \
-                                          '<extra></extra>'
-                
-                fig.data[1].hovertemplate = '<b>Sell-in por Grupo</b><br>' + \
-                                          'Período: %{x}<br>' + \
-                                          'Valor: %{y:,.0f}<br>' + \
-                                          '<extra></extra>'
-                
-                fig.data[2].hovertemplate = '<b>Sell-out por Grupo</b><br>' + \
-                                          'Período: %{x}<br>' + \
-                                          'Valor: %{y:,.0f}<br>' + \
-                                          '<extra></extra>'
-                
-                fig.update_layout(
-                    xaxis_title='Período',
-                    yaxis_title='Quantidade',
-                    height=400,
-                    legend=dict(
-                        yanchor="top",
-                        y=0.99,
-                        xanchor="left",
-                        x=0.01
-                    ),
-                    hovermode='x unified'  # Mostra todos os valores no mesmo ponto
-                )
-                st.plotly_chart(fig, width='stretch')
-
-            elif produto_selecionado != 'All' and farmacia_selecionada != 'All':
-                # Mostrar Estoque por Farmácia específica com Sell-in e Sell-out
-                fig = px.line(
-                    df_grafico,
-                    x='mes_ano_dt',
-                    y='Estoque por Produto e Grupo',
-                    title=f'Estoque, Sell-in e Sell-out - {produto_selecionado} - {farmacia_selecionada}',
-                    markers=True
-                )
-                
-                # Adicionar linha de Sell-in (verde)
-                fig.add_trace(px.line(
-                    df_grafico,
-                    x='mes_ano_dt',
-                    y='Sell-in',
-                    markers=True,
-                    color_discrete_sequence=['green']
-                ).data[0].update(name='Sell-in'))
-                
-                # Adicionar linha de Sell-out (vermelho)
-                fig.add_trace(px.line(
-                    df_grafico,
-                    x='mes_ano_dt',
-                    y='Sell-out',
-                    markers=True,
-                    color_discrete_sequence=['red']
-                ).data[0].update(name='Sell-out'))
-                
-                # Atualizar o nome da linha de estoque
-                fig.data[0].name = 'Estoque por Produto e Grupo'
-                
-                # Configurar hover personalizado para cada linha
-                fig.data[0].hovertemplate = '<b>Estoque por Produto e Grupo</b><br>' + \
-                                          'Período: %{x}<br>' + \
-                                          'Valor: %{y:,.0f}<br>' + \
-                                          '<extra></extra>'
-                
-                fig.data[1].hovertemplate = '<b>Sell-in</b><br>' + \
-                                          'Período: %{x}<br>' + \
-                                          'Valor: %{y:,.0f}<br>' + \
-                                          '<extra></extra>'
-                
-                fig.data[2].hovertemplate = '<b>Sell-out</b><br>' + \
-                                          'Período: %{x}<br>' + \
-                                          'Valor: %{y:,.0f}<br>' + \
-                                          '<extra></extra>'
-                
-                fig.update_layout(
-                    xaxis_title='Período',
-                    yaxis_title='Quantidade',
-                    height=400,
-                    legend=dict(
-                        yanchor="top",
-                        y=0.99,
-                        xanchor="left",
-                        x=0.01
-                    ),
-                    hovermode='x unified'  # Mostra todos os valores no mesmo ponto
-                )
-                st.plotly_chart(fig, width='stretch')
-
-        # Ordenar por mês/ano, farmácia e produto
-        df_tabela = df_filtered.sort_values(['mes_ano_dt', 'Grupo', 'Descrição'])
-
-        # Exibir tabela (com as 5 colunas principais)
-        st.dataframe(
-            df_tabela[['mes_ano_dt', 'Grupo', 'Descrição', 'Sell-in', 'Sell-out', 'Diferença']],
-            width='stretch',
-            height=600, 
-            column_config={
-                "mes_ano_dt": st.column_config.DateColumn(
-                    "Mês/Ano",
-                    format="MM-YYYY" 
-                )
-            }
-        )
-
-        # Informações na sidebar
-        st.sidebar.markdown("---")
-        st.sidebar.header("📊 Resumo")
-
-        st.sidebar.info(f"""
-        **Dados filtrados:**
-        - Grupos: {df_filtered['Grupo'].nunique()}
-        - Produtos: {df_filtered['Descrição'].nunique()}
-        - Total registros: {len(df_filtered)}
-        - Período: {df_filtered['mes_ano_dt'].min().strftime('%d-%m-%Y')} a {df_filtered['mes_ano_dt'].max().strftime('%d-%m-%Y')}
-        """)
+        render_stock_tab(df_filtered, produto_selecionado, farmacia_selecionada)
 
     # ==================== ABA 2: GIRO DE ESTOQUE (VAZIA) ====================
     with tab2: